@@ -1,90 +1,155 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import numpy as np
 from datetime import datetime, timedelta, timezone
 import re
 
 # ---------------------------------------------------------
 # 1. Google Sheets 接続設定
 # ---------------------------------------------------------
-def get_gspread_client():
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+SCOPE = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+@st.cache_resource
+def _creds():
+    # 認証系モジュールは書き込み時まで必要ないので、ここで遅延importする
+    # （cache_resourceなのでimportコストが乗るのは初回だけ）
+    from google.oauth2.service_account import Credentials
+
+    # 資格情報オブジェクトも使い回す（アクセストークンは内部で自動更新される）
     creds_dict = dict(st.secrets["gcp_service_account"])
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    client = gspread.authorize(creds)
-    return client
+    return Credentials.from_service_account_info(creds_dict, scopes=SCOPE)
+
+@st.cache_resource
+def get_gspread_client():
+    import gspread
+    return gspread.authorize(_creds())
+
+@st.cache_resource
+def get_worksheet(sheet_url):
+    # 認証済みクライアントとシートのハンドルはセッションをまたいで使い回す
+    return get_gspread_client().open_by_url(sheet_url).get_worksheet(0)
 
+@st.cache_data(ttl=600, show_spinner=False)
 def load_data(sheet_url):
-    client = get_gspread_client()
-    sh = client.open_by_url(sheet_url)
-    worksheet = sh.get_worksheet(0)
-    data = worksheet.get_all_records()
-    if not data:
+    worksheet = get_worksheet(sheet_url)
+    # 生の2次元リストから直接DataFrameを組む。A:Gに範囲を限定して
+    # 右側の空列がシリアライズされるのを防ぐ
+    values = worksheet.get_values('A:G')
+    if len(values) < 2:
         return pd.DataFrame(columns=['名前', 'ステージ進捗', '戦力', '回答内容', '指定日', '上限回数', '更新日時'])
-    return pd.DataFrame(data)
+    header = values[0]
+    width = len(header)
+    # 末尾が空のセルは行が短く返ることがあるので幅を揃える
+    rows = [r + [''] * (width - len(r)) if len(r) < width else r[:width] for r in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+def reset_sheet_handles():
+    """トークン失効などでハンドルが無効になったときに、次回アクセスで作り直させる"""
+    _creds.clear()
+    get_gspread_client.clear()
+    get_worksheet.clear()
+
+@st.cache_data(show_spinner=False)
+def get_names(df):
+    """名前列のリスト化もキャッシュする（dfが同じ間は再計算しない）"""
+    if df.empty or '名前' not in df.columns:
+        return []
+    return df['名前'].astype(str).tolist()
+
+@st.cache_data(show_spinner=False)
+def get_df_indexed(df):
+    """名前をインデックスにした参照用DataFrame（選択時の行検索をハッシュ引きにする）"""
+    if df.empty or '名前' not in df.columns:
+        return df
+    return df.set_index('名前', drop=False)
+
+@st.cache_data(show_spinner=False)
+def get_name_to_row(df):
+    """名前→シート行番号の対応表（1行目が見出し、データは2行目から）"""
+    if df.empty or '名前' not in df.columns:
+        return {}
+    mapping = {}
+    for i, n in enumerate(df['名前']):
+        # 同名が複数登録されている場合は先頭行を対象にする（編集フォームの表示と同じ行）
+        mapping.setdefault(n, i + 2)
+    return mapping
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_data_public(sheet_url):
+    """公開設定のシートをCSVエクスポートで直接読む（OAuth不要・pandasのCパーサで高速）
+
+    読めない場合はNoneを返す。例外はcache_dataにキャッシュされないが、
+    Noneの結果はキャッシュされるので、非公開シートでもTTLごとに1回しか試行しない。
+    """
+    try:
+        m = re.search(r'gid=(\d+)', sheet_url)
+        gid = m.group(1) if m else '0'
+        csv_url = re.sub(r'/(edit|view).*$', '', sheet_url) + f'/export?format=csv&gid={gid}'
+        df = pd.read_csv(csv_url, dtype=str).fillna('')
+        if '名前' not in df.columns:
+            # 非公開シートだとログインページのHTMLが返ってくる
+            return None
+        return df
+    except Exception:
+        return None
+
+def update_member_data(worksheet, name_to_row, name, progress, power, answer, specific_dates, max_count):
+    # worksheetとname_to_rowは呼び出し側がキャッシュ済みのものを渡す
+    # （ここで認証やシートオープンをやり直さない）
 
-def update_member_data(sheet_url, name, progress, power, answer, specific_dates, max_count):
-    client = get_gspread_client()
-    sh = client.open_by_url(sheet_url)
-    worksheet = sh.get_worksheet(0)
-    
     # JST設定
     JST = timezone(timedelta(hours=9), 'JST')
     now_str = datetime.now(JST).strftime('%Y-%m-%d %H:%M:%S')
-    
+
     dates_str = ",".join(specific_dates)
-    
-    # A列（名前の列）をすべて取得して検索
-    name_list = worksheet.col_values(1)
-    
-    try:
-        # スプレッドシートは1行目が見出し、データは2行目から。col_valuesも1番目が1行目。
-        # リストのインデックス(0始まり) + 1 で行番号になる
-        row = name_list.index(name) + 1
-        
-        worksheet.update_cell(row, 2, progress)
-        worksheet.update_cell(row, 3, power)
-        worksheet.update_cell(row, 4, answer)
-        worksheet.update_cell(row, 5, dates_str)
-        worksheet.update_cell(row, 6, now_str)
-        worksheet.update_cell(row, 7, max_count)
-        return "更新"
-        
-    except ValueError:
+    row_values = [name, progress, power, answer, dates_str, now_str, max_count]
+
+    row = name_to_row.get(name)
+
+    if row is not None:
+        # batch_updateなら1回のPOSTで済み、今後範囲を増やす場合も同じ呼び出しにまとめられる
+        # 行全体(A:G)を書くことで名前も含め1リクエストで整合が取れる
+        body = [{"range": f"A{row}:G{row}", "values": [row_values]}]
+        worksheet.batch_update(body, value_input_option='USER_ENTERED')
+        return "更新", row_values
+    else:
         # 見つからない場合は新規登録
-        worksheet.append_row([name, progress, power, answer, dates_str, now_str, max_count])
-        return "新規登録"
+        append_members(worksheet, [row_values])
+        return "新規登録", row_values
+
+def append_members(worksheet, rows):
+    """複数メンバーの新規行も1回のAPI呼び出しで追加する"""
+    worksheet.append_rows(rows, value_input_option='USER_ENTERED',
+                          insert_data_option='INSERT_ROWS', table_range='A1')
+
+def bulk_write(sheet_url, df):
+    """DataFrame全体を1回のAPI呼び出しでシートへ書き戻す（行ごとのappend_rowは使わない）"""
+    worksheet = get_worksheet(sheet_url)
+    worksheet.clear()
+    worksheet.update(values=[df.columns.tolist()] + df.astype(str).values.tolist(),
+                     range_name='A1', value_input_option='RAW')
 
 # ---------------------------------------------------------
 # 2. 計算・変換ロジック
 # ---------------------------------------------------------
-def parse_stage(stage_str):
-    if not isinstance(stage_str, str): return (0, 0)
-    stage_str = stage_str.strip().replace('‐', '-').replace('−', '-')
-    match = re.match(r'(\d+)[^0-9]+(\d+)', stage_str)
-    if match: return (int(match.group(1)), int(match.group(2)))
-    match_single = re.match(r'(\d+)', stage_str)
-    if match_single: return (int(match_single.group(1)), 0)
-    return (0, 0)
-
-def parse_power(power_val):
-    if pd.isna(power_val) or power_val == '': return 0.0
-    s = str(power_val).upper().replace(',', '').replace('"', '').strip()
-    if 'M' in s: return float(s.replace('M', '')) * 1_000_000
-    elif 'K' in s: return float(s.replace('K', '')) * 1_000
-    try: return float(s)
-    except: return 0.0
+def parse_stage_series(series):
+    """ステージ進捗の列をまとめてパースし、(メジャー, マイナー) のDataFrameを返す"""
+    s = series.astype(str).str.strip().str.replace('[‐−]', '-', regex=True)
+    # 先頭アンカー付き: "40-60" → (40, 60)、"12" → (12, 0)、数字で始まらなければ (0, 0)
+    ext = s.str.extract(r'^(\d+)(?:[^0-9]+(\d+))?')
+    return ext.fillna(0).astype(int)
+
+def parse_power_series(series):
+    """戦力の列をまとめてパースし、float のSeriesを返す"""
+    s = series.astype(str).str.upper().str.replace('[,"\\s]', '', regex=True)
+    mult = np.where(s.str.contains('M'), 1_000_000.0, np.where(s.str.contains('K'), 1_000.0, 1.0))
+    num = pd.to_numeric(s.str.replace('[MK]', '', regex=True), errors='coerce').fillna(0.0)
+    return num * mult
 
 def generate_date_range(start_date, end_date):
-    """開始日から終了日までの日付リストを生成"""
-    delta = end_date - start_date
-    dates = []
-    for i in range(delta.days + 1):
-        d = start_date + timedelta(days=i)
-        if d.weekday() != 6: # 6は日曜日。日曜以外を追加
-            dates.append(d)
-    return dates
+    """開始日から終了日までの日付リストを生成（日曜除外）"""
+    idx = pd.date_range(start_date, end_date, freq='D')
+    return [d.date() for d in idx[idx.dayofweek != 6]]  # 6は日曜日
 
 # ---------------------------------------------------------
 # 3. アプリ画面構成
@@ -110,9 +175,23 @@ end_date = col_d2.date_input("終了日", datetime.today() + timedelta(days=13))
 # 日付リスト生成（日曜除外済み）
 target_dates = generate_date_range(start_date, end_date)
 
+# 日付の文字列表現はここで1回だけ整形し、各ループでは添字で参照する
+WEEKDAYS_JP = ["月", "火", "水", "木", "金", "土", "日"]
+date_strs = [d.strftime('%Y-%m-%d') for d in target_dates]
+md_strs = [d.strftime('%m/%d') for d in target_dates]
+day_jp_list = [WEEKDAYS_JP[d.weekday()] for d in target_dates]
+
 # --- データ読み込み ---
 try:
-    df = load_data(sheet_url)
+    if 'df_override' in st.session_state:
+        # 保存直後の再実行はローカルで更新済みのdfを1回だけ使う（次回以降は再取得）
+        df = st.session_state.pop('df_override')
+    else:
+        # 公開シートならCSVエクスポートの方が速い。読めなければgspread経由にフォールバック
+        # （Noneもキャッシュされるため、失敗した場合の再試行はTTLごとに1回だけ）
+        df = load_data_public(sheet_url)
+        if df is None:
+            df = load_data(sheet_url)
 except Exception as e:
     st.error(f"データ読み込みエラー: {e}")
     st.stop()
@@ -126,7 +205,7 @@ tab_input, tab_calc, tab_list = st.tabs(["📝 メンバー入力", "🚀 選抜
 with tab_input:
     st.header("情報の登録・更新")
     
-    existing_names = df['名前'].tolist() if not df.empty and '名前' in df.columns else []
+    existing_names = get_names(df)
     select_mode = st.radio("モード", ["既存メンバーを編集", "新規メンバー登録"], horizontal=True)
     
     input_name = ""
@@ -137,17 +216,19 @@ with tab_input:
         if existing_names:
             target_name = st.selectbox("名前を選択", existing_names)
             input_name = target_name
-            if not df.empty:
-                rows = df[df['名前'] == target_name]
-                if not rows.empty:
-                    row_data = rows.iloc[0]
-                    current_data = {
-                        'progress': str(row_data.get('ステージ進捗', '')),
-                        'power': str(row_data.get('戦力', '')),
-                        'answer': str(row_data.get('回答内容', 'いつでも')),
-                        'dates': str(row_data.get('指定日', '')).split(",") if row_data.get('指定日') else [],
-                        'max_count': int(row_data.get('上限回数')) if pd.notna(row_data.get('上限回数')) and str(row_data.get('上限回数')).isdigit() else len(target_dates)
-                    }
+            df_indexed = get_df_indexed(df)
+            if target_name in df_indexed.index:
+                row_data = df_indexed.loc[target_name]
+                # 同名が複数登録されている場合は先頭行を使う
+                if isinstance(row_data, pd.DataFrame):
+                    row_data = row_data.iloc[0]
+                current_data = {
+                    'progress': str(row_data.get('ステージ進捗', '')),
+                    'power': str(row_data.get('戦力', '')),
+                    'answer': str(row_data.get('回答内容', 'いつでも')),
+                    'dates': str(row_data.get('指定日', '')).split(",") if row_data.get('指定日') else [],
+                    'max_count': int(row_data.get('上限回数')) if pd.notna(row_data.get('上限回数')) and str(row_data.get('上限回数')).isdigit() else len(target_dates)
+                }
         else:
             st.info("データがありません。「新規メンバー登録」を行ってください。")
     else:
@@ -209,28 +290,34 @@ with tab_input:
         )
         
         db_dates = current_data.get('dates', [])
-        
+
         st.write("個別に日付を調整:")
-        # 6列グリッドに変更 (日曜がないので6日で1行)
-        cols = st.columns(6)
-        for i, d in enumerate(target_dates):
-            d_str = d.strftime('%Y-%m-%d')
-            wd_str = weekdays_map[d.weekday()]
-            label = f"{d.strftime('%m/%d')}({wd_str})"
-            
+        # 日付ごとにチェックボックスを並べるとウィジェットが日数分増えて再実行が重くなるので、
+        # 1つのdata_editorにまとめる
+        initial_flags = []
+        for i in range(len(target_dates)):
             is_checked = False
-            if wd_str in selected_weekdays:
+            if day_jp_list[i] in selected_weekdays:
                 is_checked = True
-            elif not selected_weekdays and d_str in db_dates:
+            elif not selected_weekdays and date_strs[i] in db_dates:
                 is_checked = True
-            
-            # 6で割った余りで配置
-            with cols[i % 6]:
-                if st.checkbox(label, value=is_checked, key=f"chk_{d_str}{form_key_suffix}"):
-                    selected_dates_result.append(d_str)
+            initial_flags.append(is_checked)
+
+        cal_df = pd.DataFrame({
+            '日付': [f"{md_strs[i]}({day_jp_list[i]})" for i in range(len(target_dates))],
+            '参加': initial_flags
+        })
+        edited = st.data_editor(
+            cal_df,
+            column_config={'参加': st.column_config.CheckboxColumn()},
+            disabled=['日付'],
+            hide_index=True,
+            key=f"cal{form_key_suffix}"
+        )
+        selected_dates_result = [date_strs[i] for i, v in enumerate(edited['参加']) if v]
 
     elif new_answer == "いつでも":
-        selected_dates_result = [d.strftime('%Y-%m-%d') for d in target_dates]
+        selected_dates_result = list(date_strs)
 
     # === 保存ボタン ===
     st.markdown("---")
@@ -240,9 +327,31 @@ with tab_input:
         else:
             with st.spinner("スプレッドシートに書き込み中..."):
                 try:
-                    res = update_member_data(sheet_url, input_name, new_progress, new_power, new_answer, selected_dates_result, new_max_count)
+                    save_args = (get_name_to_row(df), input_name, new_progress, new_power, new_answer, selected_dates_result, new_max_count)
+                    try:
+                        res, row_values = update_member_data(get_worksheet(sheet_url), *save_args)
+                    except Exception as api_err:
+                        # キャッシュ中のハンドルが認証切れの場合があるので、作り直して1回だけ再試行
+                        from gspread.exceptions import APIError
+                        if not isinstance(api_err, APIError):
+                            raise
+                        reset_sheet_handles()
+                        res, row_values = update_member_data(get_worksheet(sheet_url), *save_args)
                     st.success(f"完了: {input_name} さんの情報を{res}しました！")
-                    st.cache_data.clear()
+                    # 全キャッシュを消すのではなく、読み込み系だけ無効化する
+                    load_data.clear()
+                    load_data_public.clear()
+                    # 直後の再実行はシートを読み直さず、書き込んだ行を反映したdfを使う
+                    if len(df.columns) == len(row_values):
+                        str_values = [str(v) for v in row_values]
+                        if res == "更新":
+                            patched = df.copy()
+                            # シートに書いたのは1行だけなので、ローカルも同じ行だけ差し替える
+                            # （シート行番号 - 2 = DataFrameの位置。同名の他の行は触らない）
+                            patched.iloc[get_name_to_row(df)[input_name] - 2] = str_values
+                        else:
+                            patched = pd.concat([df, pd.DataFrame([str_values], columns=df.columns)], ignore_index=True)
+                        st.session_state['df_override'] = patched
                 except Exception as e:
                     st.error(f"書き込みエラー: {e}")
 
@@ -259,51 +368,65 @@ with tab_calc:
             st.error("データがありません。")
         else:
             # 1. データ準備
+            # パースは1行ずつではなく列ごとに一括で行う
+            if 'ステージ進捗' in df.columns:
+                stage_vals = parse_stage_series(df['ステージ進捗']).to_numpy()
+            else:
+                stage_vals = np.zeros((len(df), 2), dtype=int)
+            if '戦力' in df.columns:
+                power_vals = parse_power_series(df['戦力']).to_numpy()
+            else:
+                power_vals = np.zeros(len(df))
+
+            # iterrowsは1行ごとにSeriesを作って遅いので、必要な列だけ配列で取り出して回す
+            names_col = df['名前'].astype(str).to_numpy()
+            ans_col = df['回答内容'].astype(str).to_numpy() if '回答内容' in df.columns else np.full(len(df), 'いつでも')
+            dates_col = df['指定日'].astype(str).to_numpy() if '指定日' in df.columns else np.full(len(df), '')
+            max_col = df['上限回数'].astype(str).to_numpy() if '上限回数' in df.columns else None
+
             members_dict = {}
-            for _, row in df.iterrows():
-                ans = str(row.get('回答内容', 'いつでも'))
-                dates_str = str(row.get('指定日', ''))
-                
-                # 上限回数の取得
+            for i in range(len(df)):
+                dates_str = dates_col[i]
+
+                # 上限回数の取得（日数を超える値は日数と同じ意味なので丸める）
                 max_c = len(target_dates)
-                if '上限回数' in row and str(row['上限回数']).isdigit():
-                    max_c = int(row['上限回数'])
-                
-                members_dict[row['名前']] = {
-                    'progress': str(row.get('ステージ進捗', '')),
-                    'power': str(row.get('戦力', '')),
-                    'answer': ans,
-                    'specific_dates': dates_str.split(",") if dates_str else [],
+                if max_col is not None and max_col[i].isdigit():
+                    max_c = min(int(max_col[i]), len(target_dates))
+
+                members_dict[names_col[i]] = {
+                    'progress_val': (int(stage_vals[i][0]), int(stage_vals[i][1])),
+                    'power_val': float(power_vals[i]),
+                    'answer': ans_col[i],
+                    'specific_dates': frozenset(dates_str.split(",")) if dates_str else frozenset(),
                     'max_count': max_c
                 }
                 
             # 2. ランキング作成
+            date_keys = date_strs
+            date_keys_arr = np.array(date_keys)
             ranked_members = []
             for name, data in members_dict.items():
-                availability = {}
-                for d in target_dates:
-                    d_str = d.strftime('%Y-%m-%d')
-                    is_ok = False
-                    
-                    if "無理" in data['answer'] or "辞退" in data['answer'] or "回答なし" in data['answer']:
-                        is_ok = False
-                    elif data['answer'] == "いつでも":
-                        is_ok = True
-                    elif data['answer'] == "条件付き":
-                        if d_str in data['specific_dates']:
-                            is_ok = True
-                    
-                    availability[d_str] = is_ok
-                
+                # 参加可否は日付キーのdictではなくbool配列で持つ（日番号でアクセス）
+                # 回答タイプが決まれば日ごとの判定は「条件付き」のときだけ必要
+                availability = np.zeros(len(date_keys), dtype=bool)
+                if data['answer'] == "いつでも":
+                    availability[:] = True
+                elif data['answer'] == "条件付き" and data['specific_dates']:
+                    availability = np.isin(date_keys_arr, list(data['specific_dates']))
+                # 無理/辞退/回答なし は全日Falseのまま
+
                 ranked_members.append({
                     'name': name,
-                    'progress_val': parse_stage(data['progress']),
-                    'power_val': parse_power(data['power']),
+                    'progress_val': data['progress_val'],
+                    'power_val': data['power_val'],
                     'availability': availability,
+                    # 全日程参加可かはここで1回だけ判定しておく
+                    'all_available': data['answer'] == "いつでも" or bool(availability.all()),
                     'max_count': data['max_count'],
                     'answer': data['answer'],
                     'count': 0,
-                    'status': {} 
+                    # ステータスも日番号で引けるよう固定長リストで持つ
+                    'status': ["-"] * len(date_keys)
                 })
             
             # ソート
@@ -312,82 +435,98 @@ with tab_calc:
             # 3. 固定・変動の振り分け
             fixed_members = []
             variable_candidates = []
-            all_dates_keys = [d.strftime('%Y-%m-%d') for d in target_dates]
-            
+
             for m in ranked_members:
                 # 固定条件: 日曜を除く全日程に参加可能 & 上限回数クリア
-                is_all_ok = all(m['availability'][k] for k in all_dates_keys)
-                if len(fixed_members) < 10 and is_all_ok and m['max_count'] >= len(target_dates):
+                if len(fixed_members) < 10 and m['all_available'] and m['max_count'] >= len(target_dates):
                     fixed_members.append(m)
                 else:
                     variable_candidates.append(m)
             
             # 4. 日ごとの選抜
             daily_schedule = {}
-            
-            for d in target_dates:
-                d_str = d.strftime('%Y-%m-%d')
+
+            # 全日程不参加（無理/辞退/回答なし）のメンバーはここで✕を埋めてしまい、
+            # 日ごとのループからは外す（選抜に影響しないため）
+            active_candidates = []
+            for m in variable_candidates:
+                if m['availability'].any():
+                    active_candidates.append(m)
+                else:
+                    m['status'] = ["✕"] * len(date_keys)
+
+            # active_candidatesはランキング順（進捗・戦力の降順）で並んでいる。
+            # 戦力優先のキーは日をまたいで不変なので、ここで1回だけ安定ソートすれば
+            # 日ごとの並べ替えは不要になる（表示用のリスト順は変えない）
+            if mode == "平等モード":
+                presorted_candidates = active_candidates
+            else:
+                # 戦力優先モード改: 条件付きを前に寄せる（同順位内はランキング順を維持）
+                presorted_candidates = sorted(active_candidates, key=lambda x: x['answer'] != '条件付き')
+
+            # 日ごとの判定に使う値は辞書から出して行列/配列にまとめる（presorted順）
+            n_active = len(presorted_candidates)
+            n_days = len(date_keys)
+            if n_active:
+                avail_mat = np.stack([m['availability'] for m in presorted_candidates])
+            else:
+                avail_mat = np.zeros((0, n_days), dtype=bool)
+            active_names = [m['name'] for m in presorted_candidates]
+            # 回数は日数上限（<=数十）なのでint16で十分。ステータスは1文字固定
+            counts_arr = np.zeros(n_active, dtype=np.int16)
+            max_arr = np.array([m['max_count'] for m in presorted_candidates], dtype=np.int16)
+            status_mat = np.full((n_active, n_days), "-", dtype='<U1')
+
+            for j, d in enumerate(target_dates):
+                d_str = date_keys[j]
                 todays_team = []
-                
+
                 # (A) 固定
                 for fm in fixed_members:
                     todays_team.append(fm['name'])
                     fm['count'] += 1
-                    fm['status'][d_str] = "◎"
-                
+                    fm['status'][j] = "◎"
+
                 # (B) 変動
                 slots_needed = 20 - len(todays_team)
-                
-                todays_candidates = []
-                for m in variable_candidates:
-                    if m['availability'][d_str] and m['count'] < m['max_count']:
-                        todays_candidates.append(m)
-                
-                # ステータス更新（初期化）
-                for m in variable_candidates:
-                    if not m['availability'][d_str]:
-                        m['status'][d_str] = "✕"
-                    elif m['count'] >= m['max_count']:
-                        m['status'][d_str] = "済"
-                    else:
-                        m['status'][d_str] = "△"
-                
+
+                # 当日の候補と仮ステータスを配列演算で一括判定
+                col = avail_mat[:, j] if n_active else np.zeros(0, dtype=bool)
+                exhausted = counts_arr >= max_arr
+                day_status = np.where(~col, "✕", np.where(exhausted, "済", "△"))
+
+                eligible = np.where(col & ~exhausted)[0]
+                if mode == "平等モード":
+                    # 候補はランキング順のまま並んでいるので、変動するcountだけの
+                    # 安定ソートで (count, 進捗, 戦力) 順と同じになる
+                    eligible = eligible[np.argsort(counts_arr[eligible], kind='stable')]
+
                 if slots_needed > 0:
-                    if mode == "平等モード":
-                        todays_candidates.sort(key=lambda x: (x['count'], -x['progress_val'][0], -x['progress_val'][1], -x['power_val']))
-                    else:
-                        # 戦力優先モード改
-                        todays_candidates.sort(key=lambda x: (
-                            x['answer'] != '条件付き', 
-                            -x['progress_val'][0], 
-                            -x['progress_val'][1], 
-                            -x['power_val']
-                        ))
-                    
-                    for c in todays_candidates[:slots_needed]:
-                        todays_team.append(c['name'])
-                        c['count'] += 1
-                        c['status'][d_str] = "〇"
-                
+                    picks = eligible[:slots_needed]
+                    counts_arr[picks] += 1
+                    day_status[picks] = "〇"
+                    todays_team.extend(active_names[i] for i in picks)
+
+                status_mat[:, j] = day_status
+
                 daily_schedule[d_str] = todays_team
 
+            # 実績カウントとステータスを表示用のdictへ書き戻す
+            for i, m in enumerate(presorted_candidates):
+                m['count'] = int(counts_arr[i])
+                m['status'] = status_mat[i].tolist()
+
             # 5. 結果表示
             st.subheader("📊 選抜結果マトリクス表")
             st.caption("記号の意味： ◎=固定枠, 〇=変動枠, △=選考漏れ, 済=回数制限到達, ✕=不参加")
 
-            matrix_data = []
             display_order = fixed_members + variable_candidates
-            
-            for m in display_order:
-                row = {"名前": m['name'], "上限": m['max_count']}
-                for d in target_dates:
-                    d_str = d.strftime('%Y-%m-%d')
-                    short_date = d.strftime('%m/%d')
-                    row[short_date] = m['status'].get(d_str, "-")
-                row["実績"] = m['count']
-                matrix_data.append(row)
-            
-            df_matrix = pd.DataFrame(matrix_data)
+
+            # 列が固定なので、行dictのリストではなく2次元リスト+列名で一気に構築する
+            matrix_cols = ["名前", "上限"] + md_strs + ["実績"]
+            matrix_rows = [[m['name'], m['max_count'], *m['status'], m['count']] for m in display_order]
+
+            df_matrix = pd.DataFrame(matrix_rows, columns=matrix_cols)
             # インデックスを1から開始
             df_matrix.index = df_matrix.index + 1
             st.dataframe(df_matrix, use_container_width=True)
@@ -397,6 +536,7 @@ with tab_calc:
             st.subheader("📋 告知用コピーテキスト")
             
             fixed_names = [m['name'] for m in fixed_members]
+            fixed_set = set(fixed_names)  # 日別リストの除外判定用
             
             # ボックス1: 固定メンバー一覧
             st.markdown("##### 🔰 固定メンバー一覧")
@@ -405,20 +545,27 @@ with tab_calc:
             # ボックス2: 日別リスト
             st.markdown("##### 📅 日別参加メンバー")
             
-            for d in target_dates:
-                d_str = d.strftime('%Y-%m-%d')
-                day_jp = ["月","火","水","木","金","土","日"][d.weekday()]
-                
+            # 全日分まとめテキストは += ではなくリストに溜めて最後にjoinする
+            parts = [f"固定メンバー: {', '.join(fixed_names)}\n\n"]
+
+            for j in range(len(target_dates)):
+                d_str = date_strs[j]
+
                 all_mems = daily_schedule.get(d_str, [])
-                variable_mems = [n for n in all_mems if n not in fixed_names]
-                
+                variable_mems = [n for n in all_mems if n not in fixed_set]
+
                 # 見出しとして日付を表示（コピー対象外）
-                st.markdown(f"**{d.strftime('%m/%d')}({day_jp})**")
-                
+                st.markdown(f"**{md_strs[j]}({day_jp_list[j]})**")
+
                 # コピー対象テキスト（日付なし、末尾修正）
                 line = f"固定メンバー、{', '.join(variable_mems)} よろしくお願いします。"
-                
+
                 st.code(line, language="text")
+                parts.append(f"{md_strs[j]}({day_jp_list[j]})\n{line}\n\n")
+
+            # ボックス3: 全日程まとめ
+            st.markdown("##### 🗒️ 全日程まとめてコピー")
+            st.text_area("全日程まとめ", "".join(parts), height=200, label_visibility="collapsed")
 
 # -----------------
 # Tab 3: 一覧確認
@@ -426,7 +573,17 @@ with tab_calc:
 with tab_list:
     st.header("現在の登録状況")
     if st.button("データ再読み込み"):
-        st.cache_data.clear()
+        load_data.clear()
+        load_data_public.clear()
         st.rerun()
     if not df.empty:
-        st.dataframe(df)
\ No newline at end of file
+        st.dataframe(df)
+        if st.button("一括保存（表示中のデータでシート全体を書き戻し）"):
+            with st.spinner("スプレッドシートに書き込み中..."):
+                try:
+                    bulk_write(sheet_url, df)
+                    st.success("シート全体を書き戻しました。")
+                    load_data.clear()
+                    load_data_public.clear()
+                except Exception as e:
+                    st.error(f"書き込みエラー: {e}")
\ No newline at end of file